@@ -17,7 +17,6 @@ print("Number of Nodes in W Direction: ", specimen.Nw)
 print("Number of Nodes in T Direction: ", specimen.Nt)
 print("Mesh Quality: ", specimen.skewness)
 specimen.generateMesh()
-specimen.writeMesh()
+specimen.findFibers()
+specimen.writeMesh(True, True)
 print(specimen)
-specimen.printNodes()
-specimen.printElements()
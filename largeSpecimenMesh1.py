@@ -17,7 +17,6 @@ name = "Large_Specimen_Mesh1"
 specimen = Mesh(length, width, thickness, name, Nl, Nw, Nt)
 print("Mesh Quality: ", specimen.skewness)
 specimen.generateMesh()
-specimen.writeMesh()
+specimen.findFibers()
+specimen.writeMesh(True, True)
 print(specimen)
-specimen.printNodes()
-specimen.printElements()
@@ -0,0 +1,128 @@
+from importlib.util import find_spec
+
+# Defines compiled numeric kernels for voxel mesh generation. Numba is an
+# optional dependency: when it is not installed, NUMBA_AVAILABLE is False
+# and the Mesh methods use their NumPy implementations instead. Likewise,
+# CuPy is optional and only used for the fiber test of very large meshes.
+
+try:
+    from numba import njit, prange, config, get_num_threads, set_num_threads
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        ''' Stand-in for numba.njit that leaves the decorated kernel as plain Python
+        '''
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+# CuPy takes seconds to import and initializes CUDA, so it is only looked up
+# here and imported the first time markFibersGPU runs:
+CUPY_AVAILABLE = find_spec("cupy") is not None
+
+
+def setNumThreads(n):
+    ''' Sets the number of threads that the parallel kernels run on to n, clamped
+        to the threads that Numba was started with, and returns the previous number
+        so that it can be restored. Does nothing without Numba.
+    '''
+    if not NUMBA_AVAILABLE:
+        return 1
+    prevThreads = get_num_threads()
+    set_num_threads(max(1, min(n, config.NUMBA_NUM_THREADS)))
+    return prevThreads
+
+
+@njit(parallel = True, cache = True)
+def fillCoords(lpos, wpos, tpos, out):
+    ''' Fills the (Nl*Nw*Nt, 3) array out with the (x, y, z) coordinates of every
+        (lpos, wpos, tpos) grid point, where grid point (i, j, k) is written to
+        row i*Nw*Nt + j*Nt + k. Planes of constant l are filled in parallel.
+    '''
+    Nl = lpos.shape[0]
+    Nw = wpos.shape[0]
+    Nt = tpos.shape[0]
+    for i in prange(Nl):
+        for j in range(Nw):
+            for k in range(Nt):
+                idx = (i * Nw + j) * Nt + k
+                out[idx, 0] = lpos[i]
+                out[idx, 1] = wpos[j]
+                out[idx, 2] = tpos[k]
+
+
+@njit(parallel = True, cache = True)
+def buildMesh(lpos, wpos, tpos, coordsOut, connOut):
+    ''' Fills the node coordinates like fillCoords and, in the same pass over the
+        grid, the ((Nl-1)*(Nw-1)*(Nt-1), 8) element connectivity connOut, whose
+        row for element (i, j, k) is written while its bottom corner node is visited.
+    '''
+    Nl = lpos.shape[0]
+    Nw = wpos.shape[0]
+    Nt = tpos.shape[0]
+    stepW = Nt
+    stepL = Nw * Nt
+    for i in prange(Nl):
+        for j in range(Nw):
+            for k in range(Nt):
+                idx = (i * Nw + j) * Nt + k
+                coordsOut[idx, 0] = lpos[i]
+                coordsOut[idx, 1] = wpos[j]
+                coordsOut[idx, 2] = tpos[k]
+                if i < Nl - 1 and j < Nw - 1 and k < Nt - 1:
+                    e = (i * (Nw - 1) + j) * (Nt - 1) + k
+                    connOut[e, 0] = idx
+                    connOut[e, 1] = idx + stepW
+                    connOut[e, 2] = idx + stepW + 1
+                    connOut[e, 3] = idx + 1
+                    connOut[e, 4] = idx + stepL
+                    connOut[e, 5] = idx + stepL + stepW
+                    connOut[e, 6] = idx + stepL + stepW + 1
+                    connOut[e, 7] = idx + stepL + 1
+
+
+@njit(parallel = True, cache = True)
+def markFibers(cy, cz, yc, zc, Rw, Rt, out):
+    ''' Sets out[e] to True if the centroid (cy[e], cz[e]) of element e lies inside
+        any of the fiber ellipses centered at (yc[f], zc) with radii Rw and Rt.
+        Elements are tested in parallel, and each element stops at the first
+        fiber that encloses it, so no (elements, fibers) array is ever formed.
+    '''
+    for e in prange(cy.shape[0]):
+        dz = (cz[e] - zc)**2/(Rt**2)
+        isFiber = False
+        for f in range(yc.shape[0]):
+            if (cy[e] - yc[f])**2/(Rw**2) + dz <= 1:
+                isFiber = True
+                break
+        out[e] = isFiber
+
+
+def markFibersGPU(cy, cz, yc, zc, Rw, Rt):
+    ''' Returns a boolean array that is True for the elements whose centroid
+        (cy[e], cz[e]) lies inside any of the fiber ellipses centered at (yc[f], zc)
+        with radii Rw and Rt. The ellipse equation is evaluated on the GPU with CuPy.
+        Returns None if CuPy cannot be imported, cannot reach a CUDA device, or runs
+        out of device memory.
+    '''
+    try:
+        import cupy as cp
+    except ImportError:
+        return None
+    # CuPy's CUDA runtime and driver errors (e.g. no device or driver) are RuntimeErrors,
+    # and running out of device memory raises its OutOfMemoryError, a MemoryError:
+    try:
+        cy = cp.asarray(cy)
+        dz = (cp.asarray(cz) - zc)**2/(Rt**2)
+        out = cp.zeros(cy.shape[0], dtype = bool)
+        # Looping over the few fibers keeps every temporary as long as cy, so no
+        # (elements, fibers) array is formed on the device:
+        for y in yc.tolist():
+            out |= (cy - y)**2/(Rw**2) + dz <= 1
+        return cp.asnumpy(out)
+    except (RuntimeError, MemoryError):
+        return None
@@ -1,11 +1,47 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from math import ceil, floor, isclose
-from alive_progress import alive_bar
-import time
+from math import floor, isclose
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from meshKernels import NUMBA_AVAILABLE, CUPY_AVAILABLE, fillCoords, buildMesh, markFibers, markFibersGPU, setNumThreads
 
 # Defines Node, Element, and Mesh classes for voxel mesh generation
 
+@lru_cache(maxsize = 32)
+def _axis(end, N, dtype):
+    ''' Returns N linearly spaced coordinates from 0 to end. Meshes with the same
+        geometry share the returned array, so it is marked read-only.
+    '''
+    pos = np.linspace(0, end, N, dtype = dtype)
+    pos.flags.writeable = False
+    return pos
+
+def _exposedFaces(filled, spacing):
+    ''' Returns the (number of faces, 4, 3) corner coordinates of the faces of the
+        filled voxels that are not shared with another filled voxel, i.e. the
+        faces that are visible when the voxels are drawn. spacing holds the
+        voxel edge lengths along the three axes.
+    '''
+    # Padding with empty voxels, so that faces on the boundary are exposed:
+    padded = np.pad(filled, 1)
+    square = np.array([[0, 0], [1, 0], [1, 1], [0, 1]])
+    faces = []
+    for axis in range(3):
+        others = [a for a in range(3) if a != axis]
+        for side in (0, 1):
+            # A face is exposed if the neighboring voxel across it is empty:
+            step = [0, 0, 0]
+            step[axis] = 2 * side - 1
+            neighbor = padded[tuple(slice(1 + s, 1 + s + n) for s, n in zip(step, filled.shape))]
+            voxels = np.argwhere(filled & ~neighbor)
+            # Corners of the face in units of the voxel edge lengths:
+            corners = np.zeros((4, 3), dtype = np.int64)
+            corners[:, axis] = side
+            corners[:, others] = square
+            faces.append(voxels[:, None, :] + corners)
+    return np.concatenate(faces) * np.asarray(spacing)
+
+
 class Node:
 
     ''' A "Node" instance is a meshing object such that an overall
@@ -21,38 +57,42 @@ class Node:
                      Node 2 Coordinate Location: (x2, y2, z2)
     '''
 
-    # Global node IDs are defined on a rolling basis, which means 
-    # that after given a starting node ID, every node has an ID 
-    # which is 1 more than the previously defined node ID. The 
-    # starting node ID is called lastID and is defined as:
-    lastID = 1
+    # Nodes are built in large numbers, so their attributes are stored
+    # in fixed slots instead of a per-instance __dict__:
+    __slots__ = ('x', 'y', 'z', 'id')
 
-    def __init__(self, x, y, z):
+    def __init__(self, x, y, z, id):
         ''' Initializing instance of a node given a set of (x, y, z)
-        coordinates. Note that every time a node is initialized,
-        Node.lastID (a Node class variable) is increased by 1.
+        coordinates and its global node ID. Global node IDs are assigned
+        by the mesh, where a node's ID is 1 more than its row index in
+        the mesh's coordinate array.
 
         Initialization (input variables):
             x, y, z: (x, y, z) coordinate location of node
+            id: global node ID
 
         Attributes (static variables):
             x, y, z: (x, y, z) coordinate location of node
-            coord: (x, y, z) tuple of node coordinate
             id: global node ID
         '''
         # Instance Variables:
         self.x = x
         self.y = y
         self.z = z
-        self.coord = (x, y, z)
-        self.id = Node.lastID
-        Node.lastID += 1
+        self.id = id
+
+    @property
+    def coord(self):
+        ''' (x, y, z) tuple of node coordinate, built when asked for instead of
+            being stored next to x, y, and z
+        '''
+        return (self.x, self.y, self.z)
 
     def __eq__(self, other):
         ''' Equality method that determines whether two nodes are equivalent
             based on their coordinates
         '''
-        return all([self.x == other.x, self.y == other.y, self.z == other.z])
+        return self.x == other.x and self.y == other.y and self.z == other.z
 
     def __hash__(self):
         ''' Hash method that returns coordinate of node
@@ -79,18 +119,20 @@ class Element:
     |3 _ _ _|4
     '''
 
-    # Similar to global node IDs, element IDs are defined on a 
-    # rolling basis. The starting element ID is called lastID and
-    # is defined as:
-    lastID = 1
+    # Like nodes, elements store their attributes in fixed slots:
+    __slots__ = ('nodes', 'centroid', 'id')
 
-    def __init__(self, nodes):
-        ''' Initializing instance of a element given a set of nodes. 
-        Note that every time an element is initialized, Element.lastID 
-        (an Element class variable) is increased by 1.
+    def __init__(self, nodes, id, centroid = None):
+        ''' Initializing instance of a element given a set of nodes and
+        its element ID. Similar to global node IDs, element IDs are assigned
+        by the mesh, where an element's ID is 1 more than its row index in
+        the mesh's connectivity array.
 
         Initialization (input variables):
             nodes: set of globally defined local node objects that uniquely describe an element
+            id: element ID
+            centroid: precomputed (xc, yc, zc) centroid of the element, such as a row of
+                      Mesh.getCentroids() (computed from the nodes if None)
 
         Attributes (static variables):
             nodes: set of globally defined local node objects that uniquely describe an element
@@ -101,25 +143,19 @@ class Element:
         '''
         # Instance Variables:
         self.nodes = nodes
-        self.centroid = Element.getCentroid([node.coord for node in self.nodes])
-        self.id = Element.lastID
-        Element.lastID += 1
+        if centroid is None:
+            centroid = Element.getCentroid([node.coord for node in self.nodes])
+        self.centroid = centroid
+        self.id = id
 
     @staticmethod
     def getCentroid(coordList):
         ''' Determines (x, y, z) coordinate location of element centroid
         '''
-        X = []
-        Y = []
-        Z = []
-        for coord in coordList:
-            X.append(coord[0])
-            Y.append(coord[1])
-            Z.append(coord[2])
-        Xcen = np.mean(X)
-        Ycen = np.mean(Y)
-        Zcen = np.mean(Z)
-        return [Xcen, Ycen, Zcen]
+        # Laying the coordinates out as one contiguous row per axis, so that all
+        # three means are taken in a single reduction:
+        coords = np.ascontiguousarray(np.asarray(coordList, dtype = np.float64).T)
+        return coords.mean(axis=1).tolist()
 
     def getNodes(self):
         ''' Gets nodes from element object
@@ -135,7 +171,7 @@ class Element:
     def __hash__(self):
         ''' Hash method that returns centroid of element
         '''
-        return hash(str(self.centroid))
+        return hash(tuple(self.centroid))
 
     def __str__(self):
         ''' Print method for Element object
@@ -161,7 +197,26 @@ class Mesh:
     |7 _ _ 8|_ _ _ _|9       Mesh = Elements
     '''
 
-    def __init__(self, l, w, t, name, *args, diam = 0.12, spac = 0.22, ang = 30):
+    # Node generation is only split across threads when the mesh has more
+    # nodes than parallelThreshold, since for smaller meshes the cost of
+    # starting the threads outweighs the work that they share:
+    parallelThreshold = 50000
+    # Filling the grid is bound by memory bandwidth, which a few threads already
+    # saturate, so generateMesh uses at most maxThreads threads by default:
+    maxThreads = 4
+    # The fiber test is only moved to the GPU (when CuPy is installed) for meshes
+    # with at least gpuThreshold elements, where the transfer cost is amortized:
+    gpuThreshold = 10**7
+    # Centroids are computed in slabs of centroidSlab elements:
+    centroidSlab = 65536
+    # Nodes and elements are formatted as text and written out in slabs of
+    # textSlab rows, so that the formatted text is never held all at once:
+    textSlab = 65536
+    # Rendering takes minutes and a lot of memory for meshes with more than
+    # plotThreshold elements, so plot3D skips them unless it is forced:
+    plotThreshold = 200000
+
+    def __init__(self, l, w, t, name, *args, diam = 0.12, spac = 0.22, ang = 30, dtype = np.float64, verbose = False):
         ''' Initializing instance of a mesh given a set of geometry and 
         meshing parameters. 
         
@@ -175,6 +230,9 @@ class Mesh:
                      where (li, wi, ti) corresponds to an (x, y, z) coordinate system
             name: name of mesh in string format
             diam, spac, ang: fiber diameter, spacing, and angle
+            dtype: floating point type of the node coordinates (np.float64 by default,
+                   np.float32 halves the memory of the coordinate array)
+            verbose: whether to print diagnostic output, such as the fiber radii in findFibers
             *args: R - unit element edge length OR Nl, Nw, Nt - number of elements along
                      the length, width, and thickness directions
                      ** Note that the R parameter works best when your specimen geometry is cubic
@@ -184,20 +242,31 @@ class Mesh:
             l, w, t: length, width, and thickness of mesh
             diam, spac, ang: fiber diameter, spacing, and angle
             R: unit element edge length (if creating uniform mesh, otherwise R = None)
+            delX, delY, delZ: element edge lengths along the length, width, and thickness directions
             name: name of mesh in string format
+            verbose: whether diagnostic output is printed
             Nl, Nw, Nt: number of elements along the length, width, and thickness directions
             lpos, wpos, tpos: linspace of discrete x, y, z positions given by l, w, t and Nl, Nw, Nt
-            globalNodes: hash set of all global node objects
-            elements: hash set of all element objects
-            fiberElements: hash set of all fiber element objects (may be overlap with elements attribute)
+            coords: (Nl*Nw*Nt, 3) array of node coordinates, where the row index of a node
+                    is its global node ID - 1 (filled by genNodes)
+            connectivity: ((Nl-1)*(Nw-1)*(Nt-1), 8) int32 array of the coords row indices of
+                    each element's local nodes, where the row index of an element is its
+                    element ID - 1 (filled by genElements)
+                    ** Element objects are only built from these rows when asked for **
+            centroids: ((Nl-1)*(Nw-1)*(Nt-1), 3) array of element centroids (None until
+                    computed by getCentroids)
+            numNodes, numElements: number of generated nodes and elements (0 until generated)
+            fiberMask: boolean array that is True for the rows of connectivity that are fiber
+                    elements (None until set by findFibers)
+            fiberRows, matrixRows: rows of connectivity that are fiber and matrix elements
+                    (None until set by findFibers)
+            numFibers: number of fibers that fit along the width of the mesh
+            fiberCentersY, fiberCenterZ: y coordinates and z coordinate of the fiber-ellipse
+                    centers along the w-t plane
             aspectRatio: volume aspect ratio (deviation away from perfect cube unit)
                     ** aspectRatio = volume of unit cell/ volume of unit cube, so aspectRatio = 1
                     corresponds to a high quality mesh, while aspectRatio >> 1 is a low quality mesh
         '''
-        # Resetting node and element IDs for new mesh:
-        Node.lastID = 1
-        Element.lastID = 1
-
         # Instance Variables:
         assert l > 0 and w > 0 and t > 0, "Geometries must be positive!"
         assert len(args) == 1 or len(args) == 3, "*args parameter must be of length 1 or length 3!"
@@ -224,20 +293,66 @@ class Mesh:
         assert 2 * self.Rw <= self.w or 2 * self.Rt <= self.t, "Fiber radii must be less than dimensions of sample specimen!"
         self.spac = spac
         self.ang = ang
+        # Computing the number of fibers in the mesh and the coordinates of the
+        # fiber-ellipse centers along the w-t plane once, since they only depend
+        # on the geometry:
+        w_f = 2 * self.Rw + self.spac # The total space that each fibe unit needs along the w-t plane
+        self.numFibers = floor(self.w/w_f)
+        i = np.arange(self.numFibers)
+        self.fiberCentersY = (i + 0.5) * self.spac + (2*i + 1) * self.Rw
+        self.fiberCenterZ = self.t/2
         self.name = name
-        self.globalNodes = set()
-        self.elements = set()
-        self.fiberElements = set()
+        self.verbose = verbose
+        self.centroids = None
+        self.numNodes = 0
+        self.numElements = 0
+        self.fiberMask = None
+        self.fiberRows = None
+        self.matrixRows = None
+        # Element edge lengths along the l, w, and t directions:
+        self.delX = float(l/(self.Nl - 1))
+        self.delY = float(w/(self.Nw - 1))
+        self.delZ = float(t/(self.Nt - 1))
         self.skewness = self.meshQuality()
         # Linearly spaced unit coordinates are defined such that there
         # are N(l, w, t) - where N(l, w, t) corresponds to either Nl, 
         # Nw, or Nt - coordinate nodes along the given direction, and 
         # hence N(l, w, t) - 1 elements along the given direction as 
         # well.
-        self.lpos = np.linspace(0, l, self.Nl)
-        self.wpos = np.linspace(0, w, self.Nw)
-        self.tpos = np.linspace(0, t, self.Nt)
+        self.lpos = _axis(l, self.Nl, dtype)
+        self.wpos = _axis(w, self.Nw, dtype)
+        self.tpos = _axis(t, self.Nt, dtype)
+        # Node coordinates are stored contiguously as one (x, y, z) row per node,
+        # Node objects are only built from these rows when asked for:
+        self.coords = np.empty((self.Nl * self.Nw * self.Nt, 3), dtype = dtype)
+        # Likewise, element connectivity is stored as one row of 8 node indices per element:
+        self.connectivity = np.empty(((self.Nl - 1) * (self.Nw - 1) * (self.Nt - 1), 8), dtype = np.int32)
     
+    def node(self, i):
+        ''' Returns the node object stored in row i of the coordinate array
+        '''
+        if self.numNodes == 0:
+            print("Nodes have not been generated yet!")
+            return None
+        i = range(self.numNodes)[i]
+        x, y, z = self.coords[i].tolist()
+        return Node(x, y, z, id = i + 1)
+
+    def element(self, i):
+        ''' Returns the element object stored in row i of the connectivity array
+        '''
+        if self.numElements == 0:
+            print("Elements have not been generated yet!")
+            return None
+        if self.numNodes == 0:
+            print("Nodes have not been generated yet!")
+            return None
+        i = range(self.numElements)[i]
+        centroid = None
+        if self.centroids is not None:
+            centroid = self.centroids[i].tolist()
+        return Element([self.node(n) for n in self.connectivity[i].tolist()], id = i + 1, centroid = centroid)
+
     def __str__(self):
         ''' Print method for Mesh object
         '''
@@ -246,37 +361,86 @@ class Mesh:
     def printNodes(self):
         ''' Node printing method for Mesh object
         '''
-        for node in self.getNodes():
-            print(node)
+        if self.getNumberofNodes() is None:
+            return
+        # Formatting every node the way Node.__str__ does, straight from the
+        # coordinate array and one slab of rows at a time:
+        for start in range(0, self.numNodes, Mesh.textSlab):
+            stop = min(start + Mesh.textSlab, self.numNodes)
+            table = np.empty((stop - start, 4), dtype = object)
+            table[:, 0] = np.arange(start + 1, stop + 1)
+            table[:, 1:] = self.coords[start:stop].tolist()
+            print(("Node(id=%d, (x, y, z)=(%r, %r, %r))\n" * (stop - start)) % tuple(table.ravel().tolist()), end = "")
 
     def printElements(self):
         ''' Element printing method for Mesh object
         '''
-        for element in self.getElements():
-            print(element)
-
-    def findFibers(self):
+        if self.getNumberofElements() is None:
+            return
+        # Formatting every element the way Element.__str__ does, straight from
+        # the connectivity array and one slab of rows at a time:
+        line = "Element(id=%d, node IDs=[" + ", ".join(["%d"] * 8) + "])\n"
+        for start in range(0, self.numElements, Mesh.textSlab):
+            stop = min(start + Mesh.textSlab, self.numElements)
+            table = np.column_stack([np.arange(start + 1, stop + 1), self.connectivity[start:stop] + 1])
+            print((line * (stop - start)) % tuple(table.ravel().tolist()), end = "")
+
+    def findFibers(self, numThreads = None):
         ''' Determines if elements in mesh are fiberous
         '''
-        print("W radius: ", self.Rw)
-        print("T radius: ", self.Rt)
-        for element in self.getElements():
-            if self.isElementFiber(element):
-                self.fiberElements.add(element)
+        if self.verbose:
+            print("W radius: ", self.Rw)
+            print("T radius: ", self.Rt)
+        centroids = self.getCentroids()
+        if centroids is None:
+            return
+        gpuMask = None
+        if CUPY_AVAILABLE and self.numElements >= Mesh.gpuThreshold:
+            # For very large meshes, the ellipse equation is evaluated on the GPU. If
+            # CuPy turns out to be unusable, the mask is found on the CPU below:
+            gpuMask = markFibersGPU(centroids[:, 1], centroids[:, 2], self.fiberCentersY,
+                                    self.fiberCenterZ, self.Rw, self.Rt)
+        if gpuMask is not None:
+            self.fiberMask = gpuMask
+        elif NUMBA_AVAILABLE:
+            # The compiled kernel tests the elements in parallel without forming
+            # the (number of elements, numFibers) array below:
+            self.fiberMask = np.empty(self.numElements, dtype = bool)
+            markFibers(centroids[:, 1], centroids[:, 2], self.fiberCentersY, self.fiberCenterZ,
+                       self.Rw, self.Rt, self.fiberMask)
+        elif self.numElements <= Mesh.parallelThreshold:
+            self.fiberMask = np.empty(self.numElements, dtype = bool)
+            self.markFiberSlab(0, self.numElements)
+        else:
+            self.fiberMask = np.empty(self.numElements, dtype = bool)
+            if numThreads is None:
+                numThreads = os.cpu_count() or 1
+            numThreads = max(1, numThreads)
+            # The slabs write to disjoint parts of fiberMask, so no locking is needed:
+            bounds = np.linspace(0, self.numElements, numThreads + 1).astype(int)
+            with ThreadPoolExecutor(max_workers = numThreads) as pool:
+                list(pool.map(self.markFiberSlab, bounds[:-1], bounds[1:]))
+        # The rows of the fiber and matrix elements are only looked up once:
+        self.fiberRows = np.flatnonzero(self.fiberMask)
+        self.matrixRows = np.flatnonzero(~self.fiberMask)
+
+    def markFiberSlab(self, start, stop):
+        ''' Sets the entries of fiberMask for the rows of connectivity in the range
+            [start, stop).
+        '''
+        centroids = self.centroids[start:stop]
+        # Evaluating the ellipse equation of every centroid against every fiber at
+        # once, which gives a (stop - start, numFibers) array:
+        region = (centroids[:, 1:2] - self.fiberCentersY)**2/(self.Rw**2) + (centroids[:, 2:3] - self.fiberCenterZ)**2/(self.Rt**2)
+        self.fiberMask[start:stop] = (region <= 1).any(axis=1)
 
     def isElementFiber(self, elem):
         ''' Determines if a given element in the mesh is fiberous
         '''
         coord = elem.centroid
-        # Computing the number of fibers in the mesh:
-        w_f = 2 * self.Rw + self.spac # The total space that each fibe unit needs along the w-t plane
-        n_f = floor(self.w/w_f)
-        for i in range(n_f):
-            # Defining coordinates of fiber-ellipse centers along w-t plane:
-            x_c = 0 # Position along length of specimen doesn't matter as of now
-            y_c = (i + 0.5) * self.spac + (2*i + 1) * self.Rw
-            z_c = self.t/2
-            center = [x_c, y_c, z_c]
+        x_c = 0 # Position along length of specimen doesn't matter as of now
+        for y_c in self.fiberCentersY.tolist():
+            center = [x_c, y_c, self.fiberCenterZ]
             if self.isPointinEllipse(coord, center):
                 return True
         return False
@@ -303,189 +467,252 @@ class Mesh:
         else:
             return False
 
-    def plot3D(self):
-        ''' Plots array of nodes in the form of a voxel mesh with matplotlib library functions
-        '''
+    def plot3D(self, force = False):
+        ''' Plots array of nodes in the form of a voxel mesh with matplotlib library functions.
+            Meshes with more than Mesh.plotThreshold elements are only plotted if force is True.
+        '''
+        if self.numElements > Mesh.plotThreshold and not force:
+            print("Mesh is too large to plot, call plot3D(force = True) to plot it anyway!")
+            return
+        # matplotlib is only imported when plotting, since it is slow to import
+        # and the large specimen scripts never plot:
+        import matplotlib.pyplot as plt
+        from mpl_toolkits.mplot3d.art3d import Poly3DCollection
         # Initializing figure
         fig = plt.figure()
         # Syntax for 3-D projection
-        ax = fig.gca(projection = '3d')
+        ax = fig.add_subplot(111, projection = '3d')
         ax.set_aspect('auto')
-        # Plotting
-        filled = np.ones((self.Nl - 1, self.Nw - 1, self.Nt - 1))
-        if self.getFiberElements() != None:
-            for element in self.getFiberElements():
-                linID = element.id - 1 # Must offset by one because the indexing of elements starts at 1, but array indexing starts at 0
-                arrID = np.unravel_index(linID, filled.shape)
-                filled[arrID[0], arrID[1], arrID[2]] = 0
-        x, y, z = np.indices(np.array(filled.shape) + 1)
-        ax.voxels(x * self.l/(self.Nl - 1), 
-                    y * self.w/(self.Nw - 1), 
-                    z * self.t/(self.Nt - 1), 
-                    filled, facecolors = '#1f77b430', edgecolors = 'gray')
+        # Plotting, where only the matrix voxels are filled in:
+        shape = (self.Nl - 1, self.Nw - 1, self.Nt - 1)
+        if self.fiberMask is None:
+            filled = np.ones(shape, dtype = bool)
+        else:
+            # The rows of connectivity are the flat indices of the elements in filled,
+            # so the fiber mask is already laid out as the voxel grid:
+            filled = ~self.fiberMask.reshape(shape)
+        # Only the exposed faces of the filled voxels are drawn, as one collection:
+        faces = Poly3DCollection(_exposedFaces(filled, (self.delX, self.delY, self.delZ)),
+                                 facecolors = '#1f77b430', edgecolors = 'gray')
+        ax.add_collection3d(faces)
+        ax.set_xlim(0, self.l)
+        ax.set_ylim(0, self.w)
+        ax.set_zlim(0, self.t)
         ax.set_title(self.name + " Plot")
         ax.set_xlabel('X axis - Length')
         ax.set_ylabel('Y axis - Width')
         ax.set_zlabel('Z axis - Thickness')
         plt.show()
 
-    def generateMesh(self):
-        ''' Generates node and element data.
-        '''
-        # Method starts by finding and generating all the bottom corner nodes:
-        cornerNodes = []
-        numCornerNodes = len(self.lpos[:-1]) * len(self.wpos[:-1]) * len(self.tpos[:-1])
-        with alive_bar(numCornerNodes, theme='smooth', title=f'Generating Corner Nodes...') as bar:
-            for l in self.lpos[:-1]:
-                for w in self.wpos[:-1]:
-                    for t in self.tpos[:-1]:
-                        # Creating a node object with the (l, w, t) coordinates
-                        node = Node(l, w, t)
-                        # Appending newly constructed node to global node list in mesh object:
-                        self.globalNodes.add(node)
-                        cornerNodes.append(node)
-                        time.sleep(0.0005)
-                        bar()
-        # Computing edge lengths in each direction:
-        delX = float(self.l/(self.Nl - 1))
-        delY = float(self.w/(self.Nw - 1))
-        delZ = float(self.t/(self.Nt - 1))
-        # For each corner node that was generated, there will be an additional 7 new nodes
-        # that accompany this bottom corner node for each element.
-        with alive_bar(len(cornerNodes), theme='smooth', title=f'Rest of Nodes/Elements... ') as bar:
-            for cornerNode in cornerNodes:
-                # Getting (X, Y, Z) coordinates of each corner node
-                X = cornerNode.x
-                Y = cornerNode.y
-                Z = cornerNode.z
-                # Generating array of 7 complementary nodes:
-                newCoordinates = [[X, Y + delY, Z], 
-                                    [X, Y + delY, Z + delZ],
-                                    [X, Y, Z + delZ], 
-                                    [X + delX, Y, Z],
-                                    [X + delX, Y + delY, Z], 
-                                    [X + delX, Y + delY, Z + delZ],
-                                    [X + delX, Y, Z + delZ]]
-                newNodes = []
-                for coords in newCoordinates:
-                    if not self.nodeCoordsInMesh(coords):
-                        newNodes.append(Node(coords[0], coords[1], coords[2]))
-                    else:
-                        node = self.findNode(coords)
-                        newNodes.append(node)
-                # Element generation:
-                elementNodes = [cornerNode]
-                for node in newNodes:
-                    if not self.nodeInMesh(node):
-                        self.globalNodes.add(node)
-                    elementNodes.append(node)     
-                element = Element(elementNodes)
-                self.elements.add(element)
-                time.sleep(0.0005)
-                bar()
-
-    def writeMesh(self, writeFibers, writeMatrix):
-        ''' Writes .msh file in current working directory.
+    def fillNodeSlab(self, start, stop):
+        ''' Fills the rows of coords that belong to the grid points with an l index
+            in the range [start, stop).
+        '''
+        # Broadcasting the three linearly spaced axes against one another yields
+        # every (l, w, t) combination in a single NumPy call. The flat index of
+        # grid point (i, j, k) in the resulting (Nl*Nw*Nt, 3) array is
+        # i*Nw*Nt + j*Nt + k, so each l slab is a contiguous block of rows:
+        grid = self.coords.reshape(self.Nl, self.Nw, self.Nt, 3)
+        grid[start:stop] = np.stack(np.broadcast_arrays(self.lpos[start:stop, None, None],
+                                                        self.wpos[None, :, None],
+                                                        self.tpos[None, None, :]), axis=-1)
+
+    def genNodes(self):
+        ''' Generates the node coordinates of every (l, w, t) grid point.
+        '''
+        # With Numba installed, the coordinates are filled by a compiled loop
+        # that is parallel over the l direction:
+        if NUMBA_AVAILABLE:
+            fillCoords(self.lpos, self.wpos, self.tpos, self.coords)
+        else:
+            self.fillNodeSlab(0, self.Nl)
+        self.numNodes = len(self.coords)
+
+    def genNodesParallel(self, numThreads = None):
+        ''' Generates the nodes of every (l, w, t) grid point like genNodes, but
+            fills the coordinates of disjoint l slabs on separate threads.
+        '''
+        if NUMBA_AVAILABLE or len(self.coords) <= Mesh.parallelThreshold:
+            self.genNodes()
+            return
+        if numThreads is None:
+            numThreads = os.cpu_count() or 1
+        numThreads = max(1, min(numThreads, self.Nl))
+        # The slabs write to disjoint blocks of rows, so no locking is needed:
+        bounds = np.linspace(0, self.Nl, numThreads + 1).astype(int)
+        with ThreadPoolExecutor(max_workers = numThreads) as pool:
+            list(pool.map(self.fillNodeSlab, bounds[:-1], bounds[1:]))
+        self.numNodes = len(self.coords)
+
+    def genElements(self):
+        ''' Generates the element connectivity, i.e. the row indices in coords of
+            the 8 local nodes of every element.
+        '''
+        # The bottom corner node of element (i, j, k) has flat index i*Nw*Nt + j*Nt + k,
+        # and its 7 complementary nodes are offset from it by a step of 1 along t,
+        # Nt along w, and Nw*Nt along l. The sparse grid keeps i, j, and k as 1-D
+        # axes that only broadcast to the full element grid when base is formed:
+        i, j, k = np.ogrid[:self.Nl - 1, :self.Nw - 1, :self.Nt - 1]
+        stepW = self.Nt
+        stepL = self.Nw * self.Nt
+        base = i * stepL + j * stepW + k
+        # Stacking straight into the preallocated int32 array avoids a separate cast:
+        grid = self.connectivity.reshape(self.Nl - 1, self.Nw - 1, self.Nt - 1, 8)
+        np.stack([base,
+                  base + stepW,
+                  base + stepW + 1,
+                  base + 1,
+                  base + stepL,
+                  base + stepL + stepW,
+                  base + stepL + stepW + 1,
+                  base + stepL + 1], axis=-1, out=grid)
+        self.numElements = len(self.connectivity)
+
+    def generateMesh(self, numThreads = None):
+        ''' Generates node and element data, using at most numThreads threads
+            (Mesh.maxThreads or the number of CPUs, whichever is smaller, by default).
+        '''
+        if numThreads is None:
+            numThreads = min(Mesh.maxThreads, os.cpu_count() or 1)
+        if NUMBA_AVAILABLE:
+            # The compiled kernel fills the node coordinates and the element
+            # connectivity in a single pass over the grid. The grid is bound by
+            # memory bandwidth, so the kernel is run on a capped number of threads:
+            prevThreads = setNumThreads(numThreads)
+            try:
+                buildMesh(self.lpos, self.wpos, self.tpos, self.coords, self.connectivity)
+            finally:
+                setNumThreads(prevThreads)
+            self.numNodes = len(self.coords)
+            self.numElements = len(self.connectivity)
+        else:
+            self.genNodesParallel(numThreads)
+            self.genElements()
+
+    def writeMesh(self, writeFibers, writeMatrix, binary = False):
+        ''' Writes .msh file in current working directory. If binary is True, the
+            same node and element data are instead saved as NumPy arrays in a .npz
+            archive (nodeIDs, coords, elementIDs, and connectivity), which skips
+            formatting the numbers as text.
         '''
         # Writing to file
-        def writeElements(elemList, isFiber):
+        def writeElements(elemRows, isFiber):
             # File Keywords:
             format = "$MeshFormat\n"
             formatNum = "4.1 0 8\n"
             formatEnd = "$EndMeshFormat\n"
             nodes = "$Nodes\n"
-            numNodes = str(self.getNumberofNodes()) + "\n"
             nodesEnd = "$EndNodes\n"
             elements = "$Elements\n"
-            numElements = str(self.getNumberofElements()) + "\n"
-            elementType = " 5 "
-            numTags = "0 0 0"
+            elementType = 5
+            numTags = 3
             elementsEnd = "$EndElements\n"
-            nodeList = []
-            idDict = {}
-            i = 1
-            for elem in elemList:
-                for node in elem.getNodes():
-                    if node not in nodeList:
-                        nodeList.append(node)
-                        # idDictionary maps the node id's to a an ordered sequence of id's starting at 1
-                        idDict[node.id] = i
-                        i += 1
-            numNodes = str(len(nodeList)) + "\n"
-            numElements = str(len(elemList)) + "\n"
+            # Rows of the connectivity array that are written, and the nodes that they use:
+            elemIDs = elemRows + 1
+            conn = self.connectivity[elemRows]
+            nodeRows = np.unique(conn)
+            # idMap maps the global node rows to an ordered sequence of id's starting at 1
+            idMap = np.zeros(len(self.coords), dtype = np.int64)
+            idMap[nodeRows] = np.arange(1, len(nodeRows) + 1)
+            numNodes = str(len(nodeRows)) + "\n"
+            numElements = str(len(elemIDs)) + "\n"
+            name = self.name
             if isFiber:
-                barTitle = f'Writing ' 'Fiber'+ ' Mesh File(.msh)... '
+                name += "_fiber"
             else:
-                barTitle = f'Writing ' 'Matrix'+ ' Mesh File(.msh)...'
-            with alive_bar(len(nodeList) + len(elemList), theme='smooth', title=barTitle) as bar:
-                name = self.name
-                if isFiber:
-                    name += "_fiber"
-                else:
-                    name += "_matrix"
-                with open(name + ".msh", "w") as file:
-                    # Writing data to a file
-                    file.writelines([format, formatNum, formatEnd, nodes, numNodes])
-                    for node in nodeList:
-                        file.write(str(idDict[node.id]) + " " + str(node.x) + " " + str(node.y) + " " + str(node.z) + "\n")
-                        time.sleep(0.0005)
-                        bar()
-                    file.writelines([nodesEnd, elements, numElements])
-                    for element in elemList:
-                        IDs = ""
-                        for node in element.nodes:
-                            IDs += " " + str(idDict[node.id])
-                        file.write(str(element.id) + elementType + numTags + IDs + "\n")
-                        time.sleep(0.0005)
-                        bar()
-                    file.write(elementsEnd)
+                name += "_matrix"
+            if binary:
+                np.savez(name + ".npz", nodeIDs = idMap[nodeRows], coords = self.coords[nodeRows],
+                         elementIDs = elemIDs, connectivity = idMap[conn])
+                return
+            elemFormat = " ".join(["%d"] * (2 + numTags + 8)) + "\n"
+            with open(name + ".msh", "w") as file:
+                file.writelines([format, formatNum, formatEnd, nodes, numNodes])
+                # Each section is formatted and written one slab of rows at a time, as a
+                # single string per slab:
+                for start in range(0, len(nodeRows), Mesh.textSlab):
+                    rows = nodeRows[start:start + Mesh.textSlab]
+                    # Node table holding python ints and floats, so that %s prints the
+                    # coordinates with the shortest decimal representation that round trips
+                    # to the same float. Coordinates of lower precision are converted to
+                    # strings by numpy, which keeps that representation for their own dtype:
+                    nodeCoords = self.coords[rows]
+                    if nodeCoords.dtype != np.float64:
+                        nodeCoords = nodeCoords.astype(str)
+                    nodeTable = np.empty((len(rows), 4), dtype = object)
+                    nodeTable[:, 0] = idMap[rows]
+                    nodeTable[:, 1:] = nodeCoords
+                    file.write(("%d %s %s %s\n" * len(rows)) % tuple(nodeTable.ravel().tolist()))
+                file.writelines([nodesEnd, elements, numElements])
+                for start in range(0, len(elemIDs), Mesh.textSlab):
+                    stop = min(start + Mesh.textSlab, len(elemIDs))
+                    elemTable = np.column_stack([elemIDs[start:stop],
+                                                 np.full(stop - start, elementType),
+                                                 np.zeros((stop - start, numTags), dtype = np.int64),
+                                                 idMap[conn[start:stop]]])
+                    file.write((elemFormat * (stop - start)) % tuple(elemTable.ravel().tolist()))
+                file.write(elementsEnd)
+        if self.fiberMask is None:
+            print("Fiber elements have not been generated yet!")
+            return
         if writeFibers:
-            writeElements(self.getFiberElements(), True)
+            writeElements(self.fiberRows, True)
         if writeMatrix:
-            writeElements(self.getMatrixElements(), False)
+            writeElements(self.matrixRows, False)
 
     def meshQuality(self):
         ''' Subroutine that determines mesh quality.
         '''
-        edgeL = float(self.l/(self.Nl - 1))
-        edgeW = float(self.w/(self.Nw - 1))
-        edgeT = float(self.t/(self.Nt - 1))
-        minEdge = min([edgeL, edgeW, edgeT])
-        minVolume = float(np.multiply(np.multiply(minEdge, minEdge), minEdge))
-        actVolume = float(np.multiply(np.multiply(edgeL, edgeW), edgeT))
+        minEdge = min(self.delX, self.delY, self.delZ)
+        minVolume = minEdge * minEdge * minEdge
+        actVolume = self.delX * self.delY * self.delZ
         return actVolume/minVolume
 
+    def gridRow(self, coords):
+        ''' Subroutine that finds the row of coords holding the grid point nearest to
+            the given (x, y, z) coordinates. Since the mesh is a regular grid, the
+            (i, j, k) index of that point follows directly from the edge lengths.
+            Returns None if the nodes have not been generated yet or if the
+            coordinates lie outside of the mesh.
+        '''
+        if self.numNodes == 0:
+            return None
+        i = round(coords[0] / self.delX)
+        j = round(coords[1] / self.delY)
+        k = round(coords[2] / self.delZ)
+        if not (0 <= i < self.Nl and 0 <= j < self.Nw and 0 <= k < self.Nt):
+            return None
+        return (i * self.Nw + j) * self.Nt + k
+
     def nodeInMesh(self, node):
         ''' Subroutine that determins whether the input node is already
             defined within the context of the mesh.
         '''
-        for meshNode in self.globalNodes:
-            if meshNode == node:
-                return True
-        return False
+        row = self.gridRow(node.coord)
+        if row is None:
+            return False
+        return tuple(self.coords[row].tolist()) == (node.x, node.y, node.z)
 
     def nodeCoordsInMesh(self, nodeCoords):
         ''' Subroutine that determins whether the input node coordinates are already
             defined within the context of the mesh.
         '''
-        X = nodeCoords[0]
-        Y = nodeCoords[1]
-        Z = nodeCoords[2]
-        for meshNode in self.globalNodes:
-            if all([isclose(meshNode.x, X), isclose(meshNode.y, Y), isclose(meshNode.z, Z)]):
-                return True
-        return False
+        return self.findNode(nodeCoords) is not None
 
     def findNode(self, coords):
         ''' Subroutine that finds the node object with the given coordinates.
             Returns None if no node with the given coordinates are found.
         '''
-        X = coords[0]
-        Y = coords[1]
-        Z = coords[2]
-        for meshNode in self.globalNodes:
-            if all([isclose(meshNode.x, X), isclose(meshNode.y, Y), isclose(meshNode.z, Z)]):
-                return meshNode
+        row = self.gridRow(coords)
+        if row is None:
+            return None
+        X, Y, Z = self.coords[row].tolist()
+        # The coordinates are stored in the mesh's dtype, so the query is rounded to
+        # it as well and compared within a tolerance that dtype can resolve:
+        x, y, z = np.asarray(coords[:3], dtype = self.coords.dtype).tolist()
+        relTol = max(1e-9, 4 * float(np.finfo(self.coords.dtype).eps))
+        if isclose(X, x, rel_tol = relTol) and isclose(Y, y, rel_tol = relTol) and isclose(Z, z, rel_tol = relTol):
+            return self.node(row)
         return None
 
 
@@ -493,97 +720,116 @@ class Mesh:
 
     # Getter methods:
     def getNodes(self):
-        ''' Returns the nodes defined within the current context of the mesh.
+        ''' Returns the nodes defined within the current context of the mesh,
+            built from the coordinate array on demand.
         '''
-        if len(self.globalNodes) == 0:
+        if self.numNodes == 0:
+            print("Nodes have not been generated yet!")
+            return None
+        return {self.node(i) for i in range(self.numNodes)}
+
+    def getCentroids(self):
+        ''' Returns the (x, y, z) centroids of all elements as one array, computed
+            from the connectivity the first time they are asked for.
+        '''
+        if self.numElements == 0:
+            print("Elements have not been generated yet!")
+            return None
+        if self.numNodes == 0:
             print("Nodes have not been generated yet!")
             return None
-        return self.globalNodes
+        if self.centroids is None:
+            self.centroids = np.empty((self.numElements, 3), dtype = np.float64)
+            # Filling the centroids in slabs of elements keeps the temporary corner
+            # arrays small no matter how large the mesh is:
+            for start in range(0, self.numElements, Mesh.centroidSlab):
+                self.fillCentroidSlab(start, min(start + Mesh.centroidSlab, self.numElements))
+        return self.centroids
+
+    def fillCentroidSlab(self, start, stop):
+        ''' Fills the rows of centroids that belong to the rows of connectivity in
+            the range [start, stop).
+        '''
+        conn = self.connectivity[start:stop]
+        corner = lambda n: self.coords[conn[:, n]].astype(np.float64, copy = False)
+        # Adding the 8 local node coordinates in the pairwise order that np.mean
+        # uses for 8 values, so each centroid is bit for bit the one that
+        # Element.getCentroid computes:
+        total = corner(0) + corner(1)
+        total += corner(2) + corner(3)
+        upper = corner(4) + corner(5)
+        upper += corner(6) + corner(7)
+        total += upper
+        total /= 8
+        self.centroids[start:stop] = total
 
     def getNodeX(self):
         ''' Returns an array of the nodes' x-coordinates nodes defined within 
-            the current context of the mesh.
+            the current context of the mesh. The array is a view into the
+            coordinate array, so copy it before modifying it.
         '''
-        if len(self.globalNodes) == 0:
+        if self.numNodes == 0:
             print("Nodes have not been generated yet!")
             return None
-        dim = self.getNumberofNodes()
-        nodes = self.getNodes()
-        xcoords = np.empty(dim)
-        i = 0
-        for node in nodes:
-            xcoords[i] = node.x
-            i += 1
-        return xcoords
+        return self.coords[:, 0]
 
     def getNodeY(self):
         ''' Returns an array of the nodes' y-coordinates nodes defined within 
-            the current context of the mesh.
+            the current context of the mesh. The array is a view into the
+            coordinate array, so copy it before modifying it.
         '''
-        if len(self.globalNodes) == 0:
+        if self.numNodes == 0:
             print("Nodes have not been generated yet!")
             return None
-        dim = self.getNumberofNodes()
-        nodes = self.getNodes()
-        ycoords = np.empty(dim)
-        i = 0
-        for node in nodes:
-            ycoords[i] = node.y
-            i += 1
-        return ycoords
+        return self.coords[:, 1]
 
     def getNodeZ(self):
         ''' Returns an array of the nodes' z-coordinates nodes defined within 
-            the current context of the mesh.
+            the current context of the mesh. The array is a view into the
+            coordinate array, so copy it before modifying it.
         '''
-        if len(self.globalNodes) == 0:
+        if self.numNodes == 0:
             print("Nodes have not been generated yet!")
             return None
-        dim = self.getNumberofNodes()
-        nodes = self.getNodes()
-        zcoords = np.empty(dim)
-        i = 0
-        for node in nodes:
-            zcoords[i] = node.z
-            i += 1
-        return zcoords
+        return self.coords[:, 2]
 
     def getElements(self):
-        ''' Returns the elements defined within the current context of the mesh.
+        ''' Returns the elements defined within the current context of the mesh,
+            built from the connectivity array on demand.
         '''
-        if len(self.elements) == 0:
+        if self.numElements == 0:
             print("Elements have not been generated yet!")
             return None
-        return self.elements
+        return {self.element(i) for i in range(self.numElements)}
 
     def getFiberElements(self):
         ''' Returns the fiber elements defined within the current context of the mesh.
         '''
-        if len(self.fiberElements) == 0:
+        if self.fiberRows is None or len(self.fiberRows) == 0:
             print("Fiber elements have not been generated yet!")
             return None
-        return self.fiberElements
+        return {self.element(i) for i in self.fiberRows.tolist()}
 
     def getMatrixElements(self):
         ''' Returns the matrix elements defined within the current context of the mesh.
         '''
-        if len(self.fiberElements) == 0:
+        if self.fiberRows is None or len(self.fiberRows) == 0:
             print("Fiber elements have not been generated yet!")
             return None
-        return self.getElements() - self.getFiberElements()
+        return {self.element(i) for i in self.matrixRows.tolist()}
 
     def getNumberofNodes(self):
         ''' Returns the number of nodes defined within the current context of the mesh.
         '''
-        if len(self.globalNodes) == 0:
+        if self.numNodes == 0:
             print("Nodes have not been generated yet!")
             return None
-        return len(self.globalNodes)
+        return self.numNodes
 
     def getNumberofElements(self):
         ''' Returns the number of elements defined within the current context of the mesh.
         '''
-        if len(self.elements) == 0:
+        if self.numElements == 0:
             print("Elements have not been generated yet!")
             return None
-        return len(self.elements)
+        return self.numElements
@@ -1,8 +1,27 @@
 from meshObjects import *
+import os
 import unittest
+from unittest import mock
+
+fastMode = os.environ.get("VOXELMESH_FAST") == "1"
 
 class TestStringMethods(unittest.TestCase):
 
+    @classmethod
+    def setUpClass(cls):
+        ''' Generates the meshes that are shared by several tests once, since
+        none of the tests modify them.
+        '''
+        # 1 x 1 x 1 unit size box with (Nl - 1)(Nw - 1)(Nt - 1) = 1 element:
+        cls.unitMesh = Mesh(1, 1, 1, "Unit _Cell_Mesh", 2, 2, 2)
+        cls.unitMesh.generateMesh()
+        # 6 x 8 x 2 box with (Nl - 1)(Nw - 1)(Nt - 1) = 3 x 5 x 7 = 105 elements:
+        cls.nonuniformMesh = Mesh(6, 8, 2, "Nonuniform_Mesh", 4, 6, 8)
+        cls.nonuniformMesh.generateMesh()
+        # 11 x 6 x 0.2 sized specimen:
+        cls.specimenMesh = Mesh(11, 6, 0.2, "Testing_Plotting", 6, 4, 3)
+        cls.specimenMesh.generateMesh()
+
     def testUnitMesh(self):
         ''' Tests unit mesh generation by defining a 1 x 1 x 1 unit
         size box that is defined by (Nl - 1)(Nw - 1)(Nt - 1) = 1 element.
@@ -13,10 +32,8 @@ class TestStringMethods(unittest.TestCase):
         Nl = 2
         Nw = 2
         Nt = 2
-        name = "Unit _Cell_Mesh"
         assert Nl == 2 and Nw == 2 and Nt == 2, "Only want 1 element for this test!"
-        unitMesh = Mesh(length, width, thickness, name, Nl, Nw, Nt)
-        unitMesh.generateMesh()
+        unitMesh = self.unitMesh
         self.assertEqual(Nl * Nw * Nt, unitMesh.getNumberofNodes())
         self.assertEqual(1, unitMesh.getNumberofElements())
         self.assertTrue(([0, length] == unitMesh.lpos).all())
@@ -32,15 +49,61 @@ class TestStringMethods(unittest.TestCase):
         Nl = 2
         Nw = 2
         Nt = 2
-        name = "Testing_Getters"
         assert Nl == 2 and Nw == 2 and Nt == 2, "Only want 1 element for this test!"
-        unitMesh = Mesh(length, width, thickness, name, Nl, Nw, Nt)
-        unitMesh.generateMesh()
+        unitMesh = self.unitMesh
+        self.assertEqual([length, width, thickness], [unitMesh.l, unitMesh.w, unitMesh.t])
         self.assertEqual(Nl * Nw * Nt, unitMesh.getNumberofNodes())
         self.assertEqual(Nl * Nw * Nt, len(unitMesh.getNodeX()))
         self.assertEqual(Nl * Nw * Nt, len(unitMesh.getNodeY()))
         self.assertEqual(Nl * Nw * Nt, len(unitMesh.getNodeZ()))
 
+    def testUngeneratedMesh(self):
+        ''' Tests that nodes and elements cannot be looked up before they are generated.
+        '''
+        emptyMesh = Mesh(1, 1, 1, "Ungenerated_Mesh", 2, 2, 2)
+        self.assertIsNone(emptyMesh.node(0))
+        # Nodes are only looked up by row, so the mesh itself is not iterable:
+        self.assertRaises(TypeError, list, emptyMesh)
+        self.assertIsNone(emptyMesh.element(0))
+        # Elements without nodes have no coordinates to average:
+        emptyMesh.genElements()
+        self.assertIsNone(emptyMesh.getCentroids())
+        self.assertIsNone(emptyMesh.element(0))
+        emptyMesh.findFibers()
+        self.assertIsNone(emptyMesh.fiberMask)
+        emptyMesh.genNodes()
+        node = emptyMesh.node(0)
+        self.assertEqual([0, 0, 0], [node.x, node.y, node.z])
+        self.assertEqual(1, emptyMesh.element(0).id)
+
+    def testSinglePrecision(self):
+        ''' Tests that a mesh generated with float32 coordinates matches the
+        default float64 mesh to single precision.
+        '''
+        length = 11
+        width = 6
+        thickness = 0.2
+        Nl = 6
+        Nw = 4
+        Nt = 3
+        name = "Single_Precision_Mesh"
+        singleMesh = Mesh(length, width, thickness, name, Nl, Nw, Nt, dtype = np.float32)
+        singleMesh.generateMesh()
+        doubleMesh = self.specimenMesh
+        self.assertEqual([Nl, Nw, Nt], [doubleMesh.Nl, doubleMesh.Nw, doubleMesh.Nt])
+        self.assertEqual(np.float32, singleMesh.coords.dtype)
+        self.assertTrue(np.allclose(doubleMesh.coords, singleMesh.coords, rtol = 1e-6))
+        self.assertTrue((doubleMesh.connectivity == singleMesh.connectivity).all())
+        # Nodes of the float32 mesh are found from the same coordinates as those of
+        # the float64 mesh:
+        for coords in [(2.2, 2.0, 0.1), (11, 6, 0.2), (0, 0, 0)]:
+            doubleNode = doubleMesh.findNode(coords)
+            singleNode = singleMesh.findNode(coords)
+            self.assertIsNotNone(singleNode)
+            self.assertEqual(doubleNode.id, singleNode.id)
+            self.assertTrue(singleMesh.nodeCoordsInMesh(coords))
+        self.assertIsNone(singleMesh.findNode((2.2, 2.0, 0.05)))
+
     def testMultiElementMesh(self):
         ''' Tests multi-element mesh generation by defining a 2 x 2 x 2 unit
         size box that is defined by (Nl - 1)(Nw - 1)(Nt - 1) = 2 x 2 x 2 = 8 elements.
@@ -58,10 +121,76 @@ class TestStringMethods(unittest.TestCase):
         print(multiMesh)
         multiMesh.printNodes()
         multiMesh.printElements()
-        multiMesh.plot3D()
+        if not fastMode:
+            multiMesh.plot3D()
         self.assertEqual(Nl * Nw * Nt, multiMesh.getNumberofNodes())
         self.assertEqual((Nl - 1) * (Nw - 1)* (Nt - 1), multiMesh.getNumberofElements())
 
+    def testElementConnectivity(self):
+        ''' Tests that every row of the connectivity array points to the 8 local nodes
+        of a single unit cell, ordered the same way as the local node IDs of an element.
+        '''
+        length = 6
+        width = 8
+        thickness = 2
+        Nl = 4
+        Nw = 6
+        Nt = 8
+        mesh = self.nonuniformMesh
+        self.assertEqual([Nl, Nw, Nt], [mesh.Nl, mesh.Nw, mesh.Nt])
+        self.assertEqual(((Nl - 1) * (Nw - 1) * (Nt - 1), 8), mesh.connectivity.shape)
+        delta = np.array([length/(Nl - 1), width/(Nw - 1), thickness/(Nt - 1)])
+        offsets = np.array([[0, 0, 0], [0, 1, 0], [0, 1, 1], [0, 0, 1],
+                            [1, 0, 0], [1, 1, 0], [1, 1, 1], [1, 0, 1]]) * delta
+        corners = mesh.coords[mesh.connectivity] - mesh.coords[mesh.connectivity[:, :1]]
+        self.assertTrue(np.allclose(offsets, corners))
+
+    def testGenerationPaths(self):
+        ''' Tests that generateMesh() gives the same node coordinates and element
+        connectivity as generating the nodes and elements separately, and as
+        filling the nodes with NumPy broadcasting.
+        '''
+        length = 7
+        width = 3
+        thickness = 2
+        Nl = 5
+        Nw = 7
+        Nt = 4
+        name = "Generation_Paths"
+        fusedMesh = Mesh(length, width, thickness, name, Nl, Nw, Nt)
+        fusedMesh.generateMesh()
+        separateMesh = Mesh(length, width, thickness, name, Nl, Nw, Nt)
+        separateMesh.genNodes()
+        separateMesh.genElements()
+        broadcastMesh = Mesh(length, width, thickness, name, Nl, Nw, Nt)
+        broadcastMesh.fillNodeSlab(0, Nl)
+        for mesh in [separateMesh, broadcastMesh]:
+            self.assertTrue((fusedMesh.coords == mesh.coords).all())
+        self.assertTrue((fusedMesh.connectivity == separateMesh.connectivity).all())
+        self.assertEqual(fusedMesh.getNumberofNodes(), separateMesh.getNumberofNodes())
+        self.assertEqual(fusedMesh.getNumberofElements(), separateMesh.getNumberofElements())
+
+    def testParallelNodes(self):
+        ''' Tests that filling the nodes in l slabs on separate threads gives the
+        same coordinates as filling them serially.
+        '''
+        length = 7
+        width = 3
+        thickness = 2
+        Nl = 9
+        Nw = 7
+        Nt = 4
+        name = "Parallel_Nodes"
+        serialMesh = Mesh(length, width, thickness, name, Nl, Nw, Nt)
+        serialMesh.fillNodeSlab(0, Nl)
+        threadedMesh = Mesh(length, width, thickness, name, Nl, Nw, Nt)
+        # Numba and small meshes both skip the threads, so neither may apply here:
+        with mock.patch("meshObjects.NUMBA_AVAILABLE", False), \
+             mock.patch.object(Mesh, "parallelThreshold", 1):
+            threadedMesh.genNodesParallel(numThreads = 3)
+        self.assertEqual(Nl * Nw * Nt, threadedMesh.getNumberofNodes())
+        self.assertTrue((serialMesh.coords == threadedMesh.coords).all())
+
     def testNonUniformMesh(self):
         ''' Tests multi-element mesh generation by defining a 6 x 8 x 2 unit
         size box that is defined by (Nl - 1)(Nw - 1)(Nt - 1) = 3 x 5 x 7 = 105 elements.
@@ -72,14 +201,13 @@ class TestStringMethods(unittest.TestCase):
         Nl = 4
         Nw = 6
         Nt = 8
-        name = "Nonuniform_Mesh"
         assert Nl == 4 and Nw == 6 and Nt == 8, "Want 105 elements for this test!"
-        nonuniform = Mesh(length, width, thickness, name, Nl, Nw, Nt)
-        nonuniform.generateMesh()
+        nonuniform = self.nonuniformMesh
         print(nonuniform)
         nonuniform.printNodes()
         nonuniform.printElements()
-        nonuniform.plot3D()
+        if not fastMode:
+            nonuniform.plot3D()
         self.assertEqual(Nl * Nw * Nt, nonuniform.getNumberofNodes())
         self.assertEqual((Nl - 1) * (Nw - 1) * (Nt - 1), nonuniform.getNumberofElements())
 
@@ -90,14 +218,19 @@ class TestStringMethods(unittest.TestCase):
         length = 15
         width = 15
         thickness = 15
-        R = 5
         name = "R_Generated_Mesh"
-        testMesh = Mesh(length, width, thickness, name, R)
-        testMesh.generateMesh()
-        print(testMesh)
-        testMesh.printNodes()
-        testMesh.printElements()
-        testMesh.plot3D()
+        for R in [5, 3]:
+            with self.subTest(R = R):
+                testMesh = Mesh(length, width, thickness, name, R)
+                testMesh.generateMesh()
+                print(testMesh)
+                testMesh.printNodes()
+                testMesh.printElements()
+                if not fastMode:
+                    testMesh.plot3D()
+                N = int(length/R) + 1
+                self.assertEqual(N**3, testMesh.getNumberofNodes())
+                self.assertEqual((N - 1)**3, testMesh.getNumberofElements())
 
     def test3DPlotting(self):
         ''' Tests 3D plotting with a 11 x 6 x 0.2 sized specimen.
@@ -108,13 +241,12 @@ class TestStringMethods(unittest.TestCase):
         Nl = 6
         Nw = 4
         Nt = 3
-        name = "Testing_Plotting"
-        testMesh = Mesh(length, width, thickness, name, Nl, Nw, Nt)
-        testMesh.generateMesh()
+        testMesh = self.specimenMesh
         print(testMesh)
         testMesh.printNodes()
         testMesh.printElements()
-        testMesh.plot3D()
+        if not fastMode:
+            testMesh.plot3D()
         self.assertEqual(Nl * Nw * Nt, testMesh.getNumberofNodes())
         self.assertEqual((Nl - 1) * (Nw - 1)* (Nt - 1), testMesh.getNumberofElements())
 
@@ -1,5 +1,10 @@
 from meshObjects import *
+import os
+import tempfile
 import unittest
+from unittest import mock
+
+fastMode = os.environ.get("VOXELMESH_FAST") == "1"
 
 class TestStringMethods(unittest.TestCase):
 
@@ -16,10 +21,79 @@ class TestStringMethods(unittest.TestCase):
         testMesh = Mesh(length, width, thickness, name, Nl, Nw, Nt, ang = 0)
         testMesh.generateMesh()
         testMesh.findFibers()
+        # 17 fibers fit along the width, and their ellipses enclose the centroids of the
+        # 2540 fiber elements in Find_Fibers_fiber.msh:
+        self.assertEqual(17, testMesh.numFibers)
+        self.assertEqual(2540, testMesh.fiberMask.sum())
+        self.assertEqual((Nl - 1) * (Nw - 1) * (Nt - 1) - 2540, len(testMesh.matrixRows))
         #testMesh.plot3D()
         writeFibers = True
         writeMatrix = True
-        testMesh.writeMesh(writeFibers, writeMatrix)
+        if not fastMode:
+            testMesh.writeMesh(writeFibers, writeMatrix)
+
+    @unittest.skipIf(fastMode, "writes mesh files")
+    def testBinaryWrite(self):
+        ''' Tests writeMesh() method with binary output.
+        '''
+        length = 1
+        width = 2
+        thickness = 0.5
+        Nl = 6
+        Nw = 21
+        Nt = 6
+        with tempfile.TemporaryDirectory() as directory:
+            # Files are named after the mesh, so a name inside the temporary
+            # directory keeps them out of the working directory:
+            name = os.path.join(directory, "Binary_Write")
+            testMesh = Mesh(length, width, thickness, name, Nl, Nw, Nt)
+            testMesh.generateMesh()
+            testMesh.findFibers()
+            testMesh.writeMesh(True, True, binary = True)
+            with np.load(name + "_fiber.npz") as fibers, np.load(name + "_matrix.npz") as matrix:
+                self.assertEqual(fibers["elementIDs"].tolist(), (testMesh.fiberRows + 1).tolist())
+                self.assertEqual(matrix["elementIDs"].tolist(), (testMesh.matrixRows + 1).tolist())
+                # Node id's of each file start at 1 and are used by its elements:
+                for data in [fibers, matrix]:
+                    self.assertEqual(data["nodeIDs"].tolist(), list(range(1, len(data["coords"]) + 1)))
+                    self.assertEqual(np.unique(data["connectivity"]).tolist(), data["nodeIDs"].tolist())
+
+    @unittest.skipIf(fastMode, "writes mesh files")
+    def testTextWrite(self):
+        ''' Tests that the .msh files written by writeMesh() hold the node and element
+        counts in their headers, and that the node id's of every element lead back
+        to the coordinates of its nodes in the mesh.
+        '''
+        length = 1
+        width = 2
+        thickness = 0.5
+        Nl = 6
+        Nw = 21
+        Nt = 6
+        with tempfile.TemporaryDirectory() as directory:
+            name = os.path.join(directory, "Text_Write")
+            testMesh = Mesh(length, width, thickness, name, Nl, Nw, Nt)
+            testMesh.generateMesh()
+            testMesh.findFibers()
+            # Small slabs, so that every section is written in several pieces:
+            with mock.patch.object(Mesh, "textSlab", 64):
+                testMesh.writeMesh(True, True)
+            for suffix, rows in [("_fiber", testMesh.fiberRows), ("_matrix", testMesh.matrixRows)]:
+                with open(name + suffix + ".msh") as file:
+                    lines = file.read().splitlines()
+                numNodes = int(lines[lines.index("$Nodes") + 1])
+                numElements = int(lines[lines.index("$Elements") + 1])
+                self.assertEqual(len(np.unique(testMesh.connectivity[rows])), numNodes)
+                self.assertEqual(len(rows), numElements)
+                start = lines.index("$Nodes") + 2
+                nodeTable = np.array([line.split() for line in lines[start:start + numNodes]], dtype = float)
+                self.assertEqual(list(range(1, numNodes + 1)), nodeTable[:, 0].astype(int).tolist())
+                start = lines.index("$Elements") + 2
+                elemTable = np.array([line.split() for line in lines[start:start + numElements]], dtype = int)
+                self.assertEqual((rows + 1).tolist(), elemTable[:, 0].tolist())
+                # Coordinates of the 8 nodes of every element, as read back from the file:
+                corners = nodeTable[elemTable[:, -8:] - 1, 1:]
+                self.assertTrue((testMesh.coords[testMesh.connectivity[rows]] == corners).all())
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,22 +1,92 @@
 from meshObjects import *
+import copy
+import os
+import sys
 import unittest
+from unittest import mock
+
+fastMode = os.environ.get("VOXELMESH_FAST") == "1"
 
 class TestStringMethods(unittest.TestCase):
 
+    @classmethod
+    def setUpClass(cls):
+        ''' Generates the base case mesh that is shared by the tests once, and finds
+        its fibers. Tests that find the fibers again work on their own copy.
+        '''
+        # 10 x 2 x 2 box with 2 fibers of diameter 0.5 across its 20 x 20 elements:
+        cls.baseMesh = Mesh(10, 2, 2, "Find_Fibers_Base_Case", 2, 21, 21, diam = 0.5, spac = 0.5, ang = 0)
+        cls.baseMesh.generateMesh()
+        cls.baseMesh.findFibers()
+
     def testFiberFinding(self):
         ''' Tests findFibers() method.
         '''
-        length = 10
-        width = 2
-        thickness = 2
-        Nl = 2
-        Nw = 21
-        Nt = 21
-        name = "Find_Fibers_Base_Case"
-        baseMesh = Mesh(length, width, thickness, name, Nl, Nw, Nt, diam = 0.5, spac = 0.5, ang = 0)
-        baseMesh.generateMesh()
-        baseMesh.findFibers()
-        baseMesh.plot3D()
+        baseMesh = self.baseMesh
+        # The 2 fibers of radius 0.25 each enclose the 4 x 4 element centroids
+        # nearest to their centers:
+        self.assertEqual(2, baseMesh.numFibers)
+        self.assertEqual(2 * 16, baseMesh.fiberMask.sum())
+        if not fastMode:
+            baseMesh.plot3D()
+
+    def testFiberMask(self):
+        ''' Tests that the vectorized fiber mask found by findFibers() agrees with
+        isElementFiber() evaluated element by element.
+        '''
+        baseMesh = self.baseMesh
+        expected = [baseMesh.isElementFiber(baseMesh.element(i)) for i in range(baseMesh.getNumberofElements())]
+        self.assertEqual(expected, baseMesh.fiberMask.tolist())
+        self.assertEqual(sum(expected), len(baseMesh.getFiberElements()))
+
+    def testGPUFallback(self):
+        ''' Tests that findFibers() uses the GPU kernel for meshes of at least
+        Mesh.gpuThreshold elements, and falls back to the CPU when CuPy is unusable.
+        '''
+        baseMesh = copy.deepcopy(self.baseMesh)
+        expected = baseMesh.fiberMask.tolist()
+        with mock.patch("meshObjects.CUPY_AVAILABLE", True), mock.patch.object(Mesh, "gpuThreshold", 1):
+            # The mask found by the GPU kernel is used as is:
+            gpuMask = np.arange(baseMesh.getNumberofElements()) % 2 == 0
+            with mock.patch("meshObjects.markFibersGPU", return_value = gpuMask):
+                baseMesh.findFibers()
+            self.assertEqual(gpuMask.tolist(), baseMesh.fiberMask.tolist())
+            # CuPy fails to import:
+            with mock.patch.dict(sys.modules, {"cupy": None}):
+                baseMesh.findFibers()
+            self.assertEqual(expected, baseMesh.fiberMask.tolist())
+            # CuPy imports, but there is no CUDA device to run on:
+            cupy = mock.Mock()
+            cupy.asarray.side_effect = RuntimeError("no CUDA-capable device is detected")
+            with mock.patch.dict(sys.modules, {"cupy": cupy}):
+                baseMesh.findFibers()
+            self.assertEqual(expected, baseMesh.fiberMask.tolist())
+            # CuPy runs out of device memory, which it raises as a MemoryError:
+            cupy.asarray.side_effect = MemoryError("out of memory allocating 1,441,792,000 bytes")
+            with mock.patch.dict(sys.modules, {"cupy": cupy}):
+                baseMesh.findFibers()
+            self.assertEqual(expected, baseMesh.fiberMask.tolist())
+            # The kernel itself, run with NumPy standing in for CuPy, finds the same mask:
+            cupy = mock.Mock(asarray = np.asarray, zeros = np.zeros, asnumpy = np.asarray)
+            with mock.patch.dict(sys.modules, {"cupy": cupy}):
+                baseMesh.findFibers()
+            self.assertEqual(expected, baseMesh.fiberMask.tolist())
+            self.assertEqual(sum(expected), len(baseMesh.fiberRows))
+
+    def testParallelFibers(self):
+        ''' Tests that marking the fiber elements in slabs on separate threads gives
+        the same fiber mask as marking them serially.
+        '''
+        baseMesh = copy.deepcopy(self.baseMesh)
+        baseMesh.fiberMask = np.empty(baseMesh.getNumberofElements(), dtype = bool)
+        baseMesh.markFiberSlab(0, baseMesh.getNumberofElements())
+        expected = baseMesh.fiberMask.tolist()
+        # Numba and small meshes both skip the threads, so neither may apply here:
+        with mock.patch("meshObjects.NUMBA_AVAILABLE", False), \
+             mock.patch.object(Mesh, "parallelThreshold", 1):
+            baseMesh.findFibers(numThreads = 3)
+        self.assertEqual(expected, baseMesh.fiberMask.tolist())
+        self.assertEqual(sum(expected), len(baseMesh.fiberRows))
 
 if __name__ == '__main__':
     unittest.main()